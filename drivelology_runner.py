@@ -0,0 +1,899 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import argparse
+from typing import Type, TypeVar
+from functools import cached_property
+
+import httpx
+import orjson
+import instructor
+import pandas as pd
+from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError
+from rich.console import Console
+from googleapiclient.discovery import build
+from google.oauth2.service_account import Credentials
+from openai import (
+    APIConnectionError,
+    APIError,
+    APIStatusError,
+    AuthenticationError,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    PermissionDeniedError,
+    RateLimitError,
+)
+from tenacity import (
+    AsyncRetrying,
+    RetryError,
+    retry_if_exception,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+from llm_cache import LLMCache
+from rate_limiter import RateLimiter, encoding_for_model, estimate_tokens
+from simplemind.providers.openai import OpenAI
+from instructor.exceptions import InstructorRetryException
+
+load_dotenv()
+console = Console()
+log = logging.getLogger(__name__)
+
+PROMPT_TEMPLATE = """
+Classify the following text into ONE of seven categories. 
+The first five are types of Drivelology (nonsense with underlying logic, irony, or conceptual twist). 
+The last two are included for contrast:
+
+Drivelology Categories:
+
+ - Reverse Punchline: Subverts expectations by delivering a literal, technically correct, or backhanded response instead of a traditional punchline.
+ - Figurative Literalism or Homophonic Pun: Takes figurative language, idioms, or homophones literally, generating comic or linguistic tension.
+ - Cultural or Linguistic Switchbait: Plays on cultural or language-specific quirks to produce paradoxes, confusion, or humorous misinterpretation.
+ - Inevitable Contradiction: Constructs statements that collapse under their own logic—self-defeating, recursive, or satirically paradoxical.
+ - Semantic Misdirection: Builds toward depth or meaning, then veers suddenly into the mundane, anticlimactic, or unrelated.
+
+Non-Drivelology Reference Categories:
+ - Pure Nonsense: Syntactically correct but semantically meaningless; lacks any deeper logic or intent.
+ - Normal Sentence: A clear, sensible statement with no twist, joke, or contradiction.
+
+INPUT TEXT: {text}
+
+Output format should be JSON with the following keys:
+ - reason: A explanation of why the text belongs to the category.
+ - category: The category the text belongs to, and it should be lowercase.
+""".strip()
+# Only {text} varies per row, so build prompts by concatenation instead of format()
+PROMPT_PREFIX, PROMPT_SUFFIX = PROMPT_TEMPLATE.split('{text}')
+
+CATEGORIES = (
+    "reverse punchline",
+    "figurative literalism or homophonic pun",
+    "cultural or linguistic switchbait",
+    "inevitable contradiction",
+    "semantic misdirection",
+    "pure nonsense",
+    "normal sentence",
+)
+# Label-only prompts ask for a category number, which is always a single token
+LABEL_PROMPT_SUFFIX = "\n\nAnswer with the number of the category only:\n" + "\n".join(
+    f"{i}. {category}" for i, category in enumerate(CATEGORIES, start=1)
+)
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class DrivelologyResponseModel(BaseModel):
+
+    reason: str
+    category: str
+
+
+def unwrap_instructor_error(exc: BaseException) -> BaseException:
+    """Return the API error behind an Instructor retry failure, if any."""
+    # Instructor re-raises API errors as InstructorRetryException from a RetryError
+    if isinstance(exc, InstructorRetryException) and isinstance(exc.__cause__, RetryError):
+        return exc.__cause__.last_attempt.exception()
+    return exc
+
+
+def is_key_exhausted(exc: BaseException) -> bool:
+    """Whether `exc` means the API key is invalid or out of quota."""
+    exc = unwrap_instructor_error(exc)
+    if isinstance(exc, (AuthenticationError, PermissionDeniedError)):
+        return True
+    if isinstance(exc, APIStatusError) and exc.status_code == 402:
+        return True
+    return isinstance(exc, RateLimitError) and (
+        exc.code == "insufficient_quota" or "per-day" in exc.message
+    )
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Whether `exc` is worth retrying with the same API key."""
+    api_error = unwrap_instructor_error(exc)
+    if is_key_exhausted(api_error):
+        return False
+    if isinstance(api_error, (RateLimitError, APIConnectionError, InternalServerError)):
+        return True
+    # Instructor gave up on unparseable output; a fresh sample may validate
+    return isinstance(exc, InstructorRetryException) and not isinstance(api_error, APIError)
+
+
+def retry_after_seconds(exc: BaseException, default: float = 60.0) -> float:
+    """How long a rate-limited key should rest, from the 429 response headers."""
+    response = getattr(unwrap_instructor_error(exc), "response", None)
+    if response is None:
+        return default
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        pass
+    try:
+        # OpenRouter reports the window reset as a millisecond timestamp
+        return max(0.0, int(response.headers["x-ratelimit-reset"]) / 1000 - time.time())
+    except (KeyError, ValueError):
+        return default
+
+
+def api_retrying() -> AsyncRetrying:
+    """Back off with full jitter on 429/5xx/network errors.
+
+    Auth and quota errors are raised immediately so the caller can switch keys.
+    """
+    return AsyncRetrying(
+        wait=wait_random_exponential(min=1, max=60),
+        stop=stop_after_attempt(6),
+        retry=retry_if_exception(is_transient_error),
+        reraise=True,
+    )
+
+
+class APIKeyExhausted(RuntimeError):
+    """No API key is left that can serve requests."""
+
+
+class KeyPoolExhausted(APIKeyExhausted):
+    """Every key in an `APIKeyPool` has been discarded."""
+
+
+class APIKeyPool:
+    """Hand out API keys round-robin, skipping keys that are cooling off."""
+
+    def __init__(self, keys: list[str]):
+        self.keys = list(keys)
+        self._index = 0
+        self._cooling_until: dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    async def acquire(self) -> str:
+        """Return the next key that is not cooling off, waiting if all are."""
+        async with self._lock:
+            while True:
+                if not self.keys:
+                    raise KeyPoolExhausted("No usable API keys left in the pool")
+                now = time.monotonic()
+                for _ in range(len(self.keys)):
+                    key = self.keys[self._index % len(self.keys)]
+                    self._index += 1
+                    if self._cooling_until.get(key, 0) <= now:
+                        return key
+                await asyncio.sleep(min(self._cooling_until[key] for key in self.keys) - now)
+
+    def cool_down(self, key: str, seconds: float) -> None:
+        self._cooling_until[key] = time.monotonic() + seconds
+
+    def discard(self, key: str) -> None:
+        if key in self.keys:
+            self.keys.remove(key)
+
+
+def load_api_keys(path: str) -> list[str]:
+    """Read one API key per line, dropping blanks and duplicates."""
+    with open(path, 'r') as f:
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+
+class AsyncOpenAIProvider(OpenAI):
+
+    NAME = "openai"
+    BASE_URL: str | None = None
+    API_KEY_ENV = "OPENAI_API_KEY"
+    # File with one API key per line to rotate through, if any
+    KEY_FILE: str | None = None
+    # gpt-4o-mini usage tier 1 limits
+    MAX_RPM = 500
+    MAX_TPM: int | None = 200_000
+    TIMEOUT = 60.0
+
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        api_key: str | None = None,
+        rate_limiter: RateLimiter | None = None,
+        cache: LLMCache | None = None,
+        key_pool: APIKeyPool | None = None,
+    ):
+        self.api_key = api_key or os.getenv(self.API_KEY_ENV)
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.key_pool = key_pool
+        # Owned by the caller, which shares it across providers and closes it
+        self.http_client = http_client
+
+    @cached_property
+    def async_client(self):
+        if not self.api_key:
+            raise ValueError("OpenAI API key is required")
+        try:
+            import openai as oa
+        except ImportError as exc:
+            raise ImportError(
+                "Please install the `openai` package: `pip install openai`"
+            ) from exc
+        return oa.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.BASE_URL,
+            http_client=self.http_client,
+            timeout=httpx.Timeout(self.TIMEOUT, connect=10.0),
+            # api_retrying() is the only retry layer; SDK retries would resend
+            # on the same key before the pool could cool it down or rotate
+            max_retries=0,
+        )
+
+    @cached_property
+    def structured_client(self) -> instructor.AsyncInstructor:
+        """An async client patched with Instructor."""
+        return instructor.from_openai(
+            self.async_client,
+            mode=instructor.Mode.JSON,
+        )
+
+    async def structured_response(
+        self,
+        prompt: str,
+        response_model: Type[T],
+        *,
+        llm_model: str | None = None,
+        **kwargs,
+    ) -> T:
+        """Get a structured response from the OpenAI API."""
+        messages = [
+            {"role": "user", "content": prompt},
+        ]
+
+        llm_model = llm_model or self.DEFAULT_MODEL
+        base_headers = kwargs.pop("extra_headers", {})
+        async for attempt in api_retrying():
+            with attempt:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire(estimate_tokens(prompt, llm_model))
+
+                extra_headers = base_headers
+                api_key = None
+                if self.key_pool is not None:
+                    # Every key shares one pooled client; only the auth header differs
+                    api_key = await self.key_pool.acquire()
+                    extra_headers = {**base_headers, "Authorization": f"Bearer {api_key}"}
+
+                try:
+                    response = await self.structured_client.chat.completions.create(
+                        messages=messages,
+                        model=llm_model,
+                        response_model=response_model,
+                        extra_headers=extra_headers,
+                        # Instructor only re-asks on invalid output; API errors
+                        # surface here so they can switch keys and back off
+                        max_retries=AsyncRetrying(
+                            stop=stop_after_attempt(3),
+                            retry=retry_if_not_exception_type(APIError),
+                        ),
+                        **{**self.DEFAULT_KWARGS, **kwargs},
+                    )
+                except Exception as e:
+                    if api_key is not None:
+                        if is_key_exhausted(e):
+                            self.key_pool.discard(api_key)
+                        elif isinstance(unwrap_instructor_error(e), RateLimitError):
+                            self.key_pool.cool_down(api_key, retry_after_seconds(e))
+                    raise
+        return response
+
+    async def generate_data(
+        self,
+        prompt: str,
+        *,
+        llm_model: str | None = None,
+        response_model: Type[BaseModel],
+        **kwargs,
+    ) -> BaseModel:
+        """Generate structured data using the provider's default model."""
+        llm_model = llm_model or self.DEFAULT_MODEL
+        if self.cache is not None:
+            cached = self.cache.get(llm_model, prompt)
+            if cached is not None:
+                return response_model.model_validate_json(cached)
+
+        response = await self.structured_response(
+            prompt=prompt,
+            llm_model=llm_model,
+            response_model=response_model,
+            **kwargs,
+        )
+        if self.cache is not None:
+            self.cache.set(llm_model, prompt, response.model_dump_json())
+        return response
+
+    async def label_response(
+        self,
+        prompt: str,
+        labels: tuple[str, ...],
+        *,
+        llm_model: str | None = None,
+        **kwargs,
+    ) -> tuple[str, float]:
+        """Pick one of `labels` by number in a single output token.
+
+        Returns the chosen label and the model's probability for it.
+        """
+        llm_model = llm_model or self.DEFAULT_MODEL
+        if self.cache is not None:
+            cached = self.cache.get(llm_model, prompt)
+            if cached is not None:
+                label, probability = orjson.loads(cached)
+                return label, probability
+
+        # Labels are numbered from 1, so at most nine fit in one digit token
+        encoding = encoding_for_model(llm_model)
+        logit_bias = {
+            str(encoding.encode(str(i))[0]): 100 for i in range(1, len(labels) + 1)
+        }
+        async for attempt in api_retrying():
+            with attempt:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire(estimate_tokens(prompt, llm_model))
+
+                response = await self.async_client.chat.completions.create(
+                    messages=[{"role": "user", "content": prompt}],
+                    model=llm_model,
+                    max_tokens=1,
+                    logit_bias=logit_bias,
+                    logprobs=True,
+                    **{**self.DEFAULT_KWARGS, **kwargs},
+                )
+        token = response.choices[0].logprobs.content[0]
+        label, probability = labels[int(token.token) - 1], math.exp(token.logprob)
+        if self.cache is not None:
+            self.cache.set(llm_model, prompt, orjson.dumps([label, probability]).decode())
+        return label, probability
+
+    async def batch_generate_data(
+        self,
+        prompts: dict[str, str],
+        *,
+        llm_model: str | None = None,
+        response_model: Type[T],
+        batch_file: str,
+        poll_interval: float = 60,
+        **kwargs,
+    ) -> dict[str, T]:
+        """Generate structured data for many prompts through the Batch API.
+
+        The keys of `prompts` become the batch `custom_id`s and key the
+        returned mapping. Requests that fail or do not validate are left out.
+        """
+        llm_model = llm_model or self.DEFAULT_MODEL
+        results = {}
+        pending = {}
+        for custom_id, prompt in prompts.items():
+            cached = self.cache.get(llm_model, prompt) if self.cache is not None else None
+            if cached is not None:
+                results[custom_id] = response_model.model_validate_json(cached)
+            else:
+                pending[custom_id] = prompt
+        if not pending:
+            return results
+
+        # The batch id outlives the process, so an interrupted run resumes
+        # polling instead of paying for the same requests twice
+        batch_id_file = os.path.splitext(batch_file)[0] + '.id'
+        batch = None
+        if os.path.exists(batch_id_file):
+            with open(batch_id_file, 'r') as f:
+                batch = await self.async_client.batches.retrieve(f.read().strip())
+            if batch.status in ("failed", "expired", "cancelled"):
+                console.log(f"Previous batch {batch.id} {batch.status}; submitting a new one.")
+                batch = None
+            else:
+                console.log(f"Resuming batch {batch.id} ({batch.status}).")
+
+        if batch is None:
+            with open(batch_file, 'wb') as f:
+                for custom_id, prompt in pending.items():
+                    request = {
+                        "custom_id": custom_id,
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": {
+                            "model": llm_model,
+                            "messages": [{"role": "user", "content": prompt}],
+                            "response_format": {"type": "json_object"},
+                            **{**self.DEFAULT_KWARGS, **kwargs},
+                        },
+                    }
+                    f.write(orjson.dumps(request, option=orjson.OPT_APPEND_NEWLINE))
+
+            with open(batch_file, 'rb') as f:
+                input_file = await self.async_client.files.create(file=f, purpose="batch")
+            batch = await self.async_client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+            with open(batch_id_file, 'w') as f:
+                f.write(batch.id)
+            console.log(f"Submitted batch {batch.id} with {len(pending)} requests.")
+
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(poll_interval)
+            batch = await self.async_client.batches.retrieve(batch.id)
+            console.log(f"Batch {batch.id}: {batch.status} {batch.request_counts}")
+        if batch.status != "completed":
+            os.remove(batch_id_file)
+            raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+
+        # Requests that failed inside the batch are only reported in the error file
+        if batch.error_file_id is not None:
+            errors = await self.async_client.files.content(batch.error_file_id)
+            for line in errors.text.splitlines():
+                record = orjson.loads(line)
+                error = record.get("error") or (record.get("response") or {}).get("body")
+                log.warning("Batch request %s failed: %s", record["custom_id"], error)
+        if batch.output_file_id is None:
+            log.warning("Batch %s produced no output: %s", batch.id, batch.request_counts)
+            os.remove(batch_id_file)
+            return results
+
+        output = await self.async_client.files.content(batch.output_file_id)
+        for line in output.text.splitlines():
+            record = orjson.loads(line)
+            custom_id = record["custom_id"]
+            if custom_id not in pending:
+                # A resumed batch may hold rows that were written or cached since
+                continue
+            if record.get("error") or record["response"]["status_code"] != 200:
+                log.warning("Batch request %s failed: %s", custom_id, record.get('error'))
+                continue
+            content = record["response"]["body"]["choices"][0]["message"]["content"]
+            try:
+                response = response_model.model_validate_json(content)
+            except ValidationError as e:
+                log.warning("Batch request %s returned invalid JSON: %s", custom_id, e)
+                continue
+            if self.cache is not None:
+                self.cache.set(llm_model, pending[custom_id], response.model_dump_json())
+            results[custom_id] = response
+        # Only forget the batch once its output is cached; a failed download
+        # resumes the same batch next run
+        os.remove(batch_id_file)
+        return results
+
+
+class OpenRouter(AsyncOpenAIProvider):
+
+    NAME = "openrouter"
+    BASE_URL = "https://openrouter.ai/api/v1"
+    API_KEY_ENV = "OPENROUTER_API_KEY"
+    KEY_FILE = "openrouter.txt"
+    # OpenRouter free-tier models allow 20 requests per minute per key
+    MAX_RPM = 20
+    MAX_TPM = None
+    # Free-tier reasoning models can think for well over a minute
+    TIMEOUT = 120.0
+
+
+PROVIDERS = {provider.NAME: provider for provider in (AsyncOpenAIProvider, OpenRouter)}
+
+# The models classified when no --provider is given, all run concurrently
+DEFAULT_JOBS = (
+    ("openrouter", "microsoft/mai-ds-r1:free", "mai_ds_r1.jsonl"),
+    ("openrouter", "qwen/qwen3-235b-a22b:free", "qwen3_235b.jsonl"),
+    ("openai", "gpt-4o-mini", "gpt_4o_mini.jsonl"),
+)
+
+
+def load_worksheet(service_file: str, spreadsheet_id: str, sheet: str = 'Sheet1') -> pd.DataFrame:
+    """Read a whole sheet with one Sheets API `values.batchGet` call."""
+    credentials = Credentials.from_service_account_file(
+        service_file,
+        scopes=['https://www.googleapis.com/auth/spreadsheets.readonly'],
+    )
+    service = build('sheets', 'v4', credentials=credentials, cache_discovery=False)
+    resp = service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=[sheet],
+        valueRenderOption='UNFORMATTED_VALUE',
+        dateTimeRenderOption='FORMATTED_STRING',
+    ).execute()
+    values = resp['valueRanges'][0].get('values', [])
+    if not values:
+        return pd.DataFrame()
+    header, rows = values[0], values[1:]
+    # The API drops trailing empty cells, so pad short rows to the header width;
+    # stray cells right of the header (e.g. notes) are cut off
+    rows = [row[:len(header)] + [''] * (len(header) - len(row)) for row in rows]
+    return pd.DataFrame(rows, columns=header)
+
+
+def load_exist_ids(save_file: str) -> set:
+    """Collect the ids already written to a JSONL output file."""
+    exist_ids = set()
+    if not os.path.exists(save_file):
+        return exist_ids
+    line = b'\n'
+    with open(save_file, 'rb') as f:
+        for line in f:
+            try:
+                exist_ids.add(orjson.loads(line)['id'])
+            except orjson.JSONDecodeError:
+                log.warning("Skip malformed line in %s: %r", save_file, line[:80])
+    if not line.endswith(b'\n'):
+        # A run killed mid-write leaves a torn last line; terminate it so the
+        # next record starts on a line of its own
+        with open(save_file, 'ab') as f:
+            f.write(b'\n')
+    return exist_ids
+
+
+async def run_pipeline(
+    groups,
+    classify,
+    write_row,
+    *,
+    workers: int,
+    prefetch: int = 100,
+    prompt_suffix: str = PROMPT_SUFFIX,
+):
+    """Classify groups of rows with `workers` concurrent API calls.
+
+    Every row in a group shares the same text, so each group costs one call.
+    A producer builds prompts ahead of the workers into a bounded queue, and a
+    single writer drains finished rows so output appends need no lock.
+    """
+    queue = asyncio.Queue(maxsize=prefetch)
+    write_queue = asyncio.Queue()
+
+    async def produce():
+        for group in groups:
+            await queue.put((group, f"{PROMPT_PREFIX}{group[0][1]}{prompt_suffix}"))
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def consume():
+        while (item := await queue.get()) is not None:
+            group, prompt = item
+            try:
+                response = await classify(prompt)
+            except APIKeyExhausted:
+                # No later row can succeed either, so fail the whole run
+                raise
+            except Exception as e:
+                log.warning("Rows %s failed: %r", [row[0] for row in group], e)
+                continue
+            await write_queue.put((group, response))
+
+    async def write():
+        while (item := await write_queue.get()) is not None:
+            group, response = item
+            for row in group:
+                write_row(*row, response)
+
+    writer = asyncio.create_task(write())
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(consume()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        # Rows finished before a failure are still written out
+        await write_queue.put(None)
+        await writer
+
+
+class DrivelologyRunner:
+    """Classify the worksheet with several models over shared resources.
+
+    Every run reuses one worksheet read, one HTTP/2 connection pool and one
+    response cache. Runs on the same provider also share its key pool and
+    rate limiter, since those quotas belong to the account, not the model.
+    """
+
+    def __init__(
+        self,
+        service_file: str,
+        spreadsheet_id: str,
+        data_dir: str = 'data',
+        max_concurrency: int = 50,
+    ):
+        self.service_file = service_file
+        self.spreadsheet_id = spreadsheet_id
+        self.data_dir = data_dir
+        self.max_concurrency = max_concurrency
+        os.makedirs(data_dir, exist_ok=True)
+        self.cache = LLMCache(os.path.join(data_dir, 'llm_cache.sqlite'))
+        # Rate-limit headers are routed back to the limiter of the host that sent them
+        self._rate_limiters: dict[str, RateLimiter] = {}
+        self.http_client = DefaultAsyncHttpxClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=100),
+            event_hooks={"response": [self._on_response]},
+        )
+        self._providers: dict[str, AsyncOpenAIProvider] = {}
+        self._rows = None
+
+    async def _on_response(self, response: httpx.Response) -> None:
+        rate_limiter = self._rate_limiters.get(response.request.url.host)
+        if rate_limiter is not None:
+            rate_limiter.update(response.headers)
+
+    def provider(self, name: str) -> AsyncOpenAIProvider:
+        """The shared client for provider `name`, created on first use."""
+        if name in self._providers:
+            return self._providers[name]
+        provider_cls = PROVIDERS[name]
+        key_pool = None
+        max_rpm = provider_cls.MAX_RPM
+        if provider_cls.KEY_FILE is not None:
+            key_pool = APIKeyPool(load_api_keys(provider_cls.KEY_FILE))
+            if not key_pool:
+                raise ValueError(f"No API keys found in {provider_cls.KEY_FILE}")
+            # Quotas are per key, and requests are spread over every key in the pool
+            max_rpm *= len(key_pool)
+        llm = provider_cls(
+            api_key=key_pool.keys[0] if key_pool else None,
+            rate_limiter=RateLimiter(max_rpm=max_rpm, max_tpm=provider_cls.MAX_TPM),
+            cache=self.cache,
+            key_pool=key_pool,
+            http_client=self.http_client,
+        )
+        if key_pool is None:
+            # Headers report one key's quota, which would drain a pool-wide limiter;
+            # per-key 429s are handled by the pool's cool-down instead
+            self._rate_limiters[llm.async_client.base_url.host] = llm.rate_limiter
+        self._providers[name] = llm
+        return llm
+
+    def rows(self) -> list[tuple]:
+        """The worksheet as `(id, text, created, modified)` tuples, read once."""
+        if self._rows is None:
+            worksheet_df = load_worksheet(self.service_file, self.spreadsheet_id)
+            console.log(worksheet_df)
+            if worksheet_df.empty:
+                # A blank sheet comes back without even the header columns
+                self._rows = []
+                return self._rows
+            worksheet_df['text'] = (
+                worksheet_df['text'].astype(str).str.replace('\n', ' ', regex=False).str.strip()
+            )
+            # Plain Python lists avoid per-row Series boxing and stay JSON serialisable
+            self._rows = list(zip(
+                worksheet_df['id'].tolist(),
+                worksheet_df['text'].tolist(),
+                worksheet_df['created_datetime'].tolist(),
+                worksheet_df['modified_datetime'].tolist(),
+            ))
+        return self._rows
+
+    async def run(
+        self,
+        provider: str,
+        model: str,
+        out: str,
+        *,
+        batch: bool = False,
+        label_only: bool = False,
+        min_label_confidence: float = 0.9,
+    ) -> None:
+        """Classify every worksheet row missing from `out` with `model`.
+
+        `batch` and `label_only` need the OpenAI API itself; in label-only
+        mode, rows below `min_label_confidence` fall back to the full answer.
+        """
+        if (batch or label_only) and provider != AsyncOpenAIProvider.NAME:
+            raise ValueError(f"Batch and label-only modes are not supported on {provider}")
+        llm = self.provider(provider)
+        save_file = os.path.join(self.data_dir, out)
+        batch_file = os.path.splitext(save_file)[0] + '.batch.jsonl'
+
+        rows = self.rows()
+        exist_ids = load_exist_ids(save_file)
+        pending = [row for row in rows if row[0] not in exist_ids]
+        console.log(f"Skip {len(rows) - len(pending)} rows already in {save_file}.")
+        # Identical texts get one API call, fanned out to every row that shares it
+        groups = {}
+        for row in pending:
+            groups.setdefault(row[1], []).append(row)
+        groups = list(groups.values())
+        console.log(f"{len(pending)} pending rows share {len(groups)} unique texts.")
+
+        def write_row(id, text, created_datetime, modified_datetime, response):
+            response_json = response.model_dump()
+            log.info("%s: done %s -> %s", model, id, response_json['category'])
+            log.debug("%s: ID: %s\nText: %s\n%r", model, id, text, response)
+
+            record = {
+                'id': id,
+                'text': text,
+                'created_datetime': created_datetime,
+                'modified_datetime': modified_datetime,
+                'reason': response_json['reason'],
+                'category': response_json['category'],
+            }
+            # Only the pipeline's single writer calls this, so lines never interleave
+            out_f.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+
+        async def classify(prompt):
+            # Each call draws keys round-robin; unusable keys are dropped from the
+            # pool, so retry until one works or the pool runs dry
+            while True:
+                try:
+                    return await llm.generate_data(
+                        prompt=prompt,
+                        llm_model=model,
+                        response_model=DrivelologyResponseModel,
+                    )
+                except (APIStatusError, InstructorRetryException) as e:
+                    if not is_key_exhausted(e):
+                        raise
+                    if llm.key_pool is None:
+                        # The provider's only key is dead, so every later row would fail too
+                        raise APIKeyExhausted(f"{provider} API key is unusable: {e}") from e
+                    log.warning(
+                        "%s: API key error: %s, %d keys left", model, e, len(llm.key_pool)
+                    )
+
+        async def classify_label(prompt):
+            try:
+                category, probability = await llm.label_response(
+                    prompt, CATEGORIES, llm_model=model
+                )
+            except APIStatusError as e:
+                if is_key_exhausted(e):
+                    raise APIKeyExhausted(f"{provider} API key is unusable: {e}") from e
+                raise
+            if probability >= min_label_confidence:
+                return DrivelologyResponseModel(reason='', category=category)
+            return await classify(prompt.removesuffix(LABEL_PROMPT_SUFFIX) + PROMPT_SUFFIX)
+
+        # Unbuffered, so every finished row is one write() without reopening the file
+        with open(save_file, 'ab', buffering=0) as out_f:
+            if batch:
+                # The Batch API is billed at half price, which suits this offline job
+                batch_groups = {str(group[0][0]): group for group in groups}
+                responses = await llm.batch_generate_data(
+                    {
+                        id: f"{PROMPT_PREFIX}{group[0][1]}{PROMPT_SUFFIX}"
+                        for id, group in batch_groups.items()
+                    },
+                    llm_model=model,
+                    response_model=DrivelologyResponseModel,
+                    batch_file=batch_file,
+                )
+                for id, response in responses.items():
+                    for row in batch_groups[id]:
+                        write_row(*row, response)
+            elif label_only:
+                await run_pipeline(
+                    groups,
+                    classify_label,
+                    write_row,
+                    workers=self.max_concurrency,
+                    prompt_suffix=LABEL_PROMPT_SUFFIX,
+                )
+            else:
+                await run_pipeline(groups, classify, write_row, workers=self.max_concurrency)
+
+    async def aclose(self) -> None:
+        await self.http_client.aclose()
+        self.cache.close()
+
+
+async def main(args: argparse.Namespace):
+    runner = DrivelologyRunner(
+        service_file=args.service_file,
+        spreadsheet_id=os.environ['DRIVELOLOGY_SPREADSHEET_ID'],
+    )
+    jobs = [(args.provider, args.model, args.out)] if args.provider else DEFAULT_JOBS
+    try:
+        results = await asyncio.gather(
+            *(
+                runner.run(
+                    provider,
+                    model,
+                    out,
+                    # Only the OpenAI API has these modes; other jobs run live
+                    batch=args.batch and provider == AsyncOpenAIProvider.NAME,
+                    label_only=args.label_only and provider == AsyncOpenAIProvider.NAME,
+                )
+                for provider, model, out in jobs
+            ),
+            # One model failing (e.g. no keys left) must not cancel the others
+            return_exceptions=True,
+        )
+    finally:
+        await runner.aclose()
+    failed = False
+    for (provider, model, out), result in zip(jobs, results):
+        if isinstance(result, BaseException):
+            log.error("%s run on %s failed: %r", model, provider, result)
+            failed = True
+    if failed:
+        raise SystemExit(1)
+
+
+def cli(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Classify the Drivelology worksheet with one or more LLMs.',
+    )
+    parser.add_argument(
+        '--provider',
+        choices=sorted(PROVIDERS),
+        help='Run a single model on this provider instead of every default job.',
+    )
+    parser.add_argument(
+        '--model',
+        help='Model name to classify with; required with --provider.',
+    )
+    parser.add_argument(
+        '--out',
+        help='Output JSONL file name under data/; required with --provider.',
+    )
+    parser.add_argument(
+        '--service-file',
+        default='drivelology-1b65510988e8.json',
+        help='Google service account file used to read the worksheet.',
+    )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help='Submit pending rows through the OpenAI Batch API instead of live requests.',
+    )
+    parser.add_argument(
+        '--label-only',
+        action='store_true',
+        help=(
+            'Ask for the category number alone in one logit-biased token; '
+            'only low-confidence rows get the full answer with a reason.'
+        ),
+    )
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        help='Log the full text and response of every row.',
+    )
+    args = parser.parse_args(argv)
+    if args.provider and not (args.model and args.out):
+        parser.error('--provider needs --model and --out')
+    if (args.model or args.out) and not args.provider:
+        parser.error('--model and --out need --provider')
+    if (args.batch or args.label_only) and args.provider not in (None, AsyncOpenAIProvider.NAME):
+        parser.error(f'--batch and --label-only are not supported on {args.provider}')
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    # httpx logs every request at INFO, which would flood the per-row output
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    log.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    asyncio.run(main(args))
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,48 @@
+import time
+import sqlite3
+import hashlib
+
+
+class LLMCache:
+    """Exact-match cache of LLM responses keyed by `(model, prompt)`."""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        # WAL lets several runs share one cache file without blocking readers
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, response JSON, expires_at REAL)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(llm_model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{llm_model}\x00{prompt}".encode()).hexdigest()
+
+    def get(self, llm_model: str, prompt: str) -> str | None:
+        """Return the cached JSON response, or None on a miss or expiry."""
+        row = self.conn.execute(
+            "SELECT response FROM cache WHERE key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (self.make_key(llm_model, prompt), time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(
+        self,
+        llm_model: str,
+        prompt: str,
+        response: str,
+        ttl: float | None = None,
+    ) -> None:
+        """Store a JSON response, optionally expiring after `ttl` seconds."""
+        expires_at = time.time() + ttl if ttl is not None else None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO cache (key, response, expires_at) VALUES (?, ?, ?)",
+            (self.make_key(llm_model, prompt), response, expires_at),
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,82 @@
+import time
+import asyncio
+from functools import lru_cache
+
+import httpx
+import tiktoken
+
+
+@lru_cache(maxsize=None)
+def encoding_for_model(llm_model: str) -> tiktoken.Encoding:
+    """The tiktoken encoding for `llm_model`, cached per model name."""
+    try:
+        return tiktoken.encoding_for_model(llm_model)
+    except KeyError:
+        # OpenRouter model names (e.g. `qwen/...`) are unknown to tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def estimate_tokens(prompt: str, llm_model: str) -> int:
+    """Estimate the prompt tokens a request will be billed for."""
+    return len(encoding_for_model(llm_model).encode(prompt))
+
+
+class RateLimiter:
+    """Dual leaky-bucket limiter over requests and tokens per minute.
+
+    Both buckets refill continuously on a monotonic clock. Provider
+    `x-ratelimit-*` headers pull the buckets down to the server's view so
+    that quota spent elsewhere (other scripts, other keys) is respected.
+    """
+
+    def __init__(self, max_rpm: int, max_tpm: int | None = None):
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self._requests = float(max_rpm)
+        self._tokens = float(max_tpm or 0)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._requests = min(self.max_rpm, self._requests + elapsed * self.max_rpm / 60)
+        if self.max_tpm:
+            self._tokens = min(self.max_tpm, self._tokens + elapsed * self.max_tpm / 60)
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one request and `tokens` tokens fit in the buckets."""
+        if self.max_tpm:
+            # A single oversized prompt must not wait forever
+            tokens = min(tokens, self.max_tpm)
+        # Holding the lock while sleeping keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                self._refill()
+                request_wait = max(0.0, (1 - self._requests) * 60 / self.max_rpm)
+                token_wait = 0.0
+                if self.max_tpm:
+                    token_wait = max(0.0, (tokens - self._tokens) * 60 / self.max_tpm)
+                wait = max(request_wait, token_wait)
+                if wait <= 0:
+                    self._requests -= 1
+                    if self.max_tpm:
+                        self._tokens -= tokens
+                    return
+                await asyncio.sleep(wait)
+
+    def update(self, headers: httpx.Headers) -> None:
+        """Clamp the buckets to the remaining quota reported by the server."""
+        remaining_requests = headers.get(
+            "x-ratelimit-remaining-requests", headers.get("x-ratelimit-remaining")
+        )
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        self._refill()
+        try:
+            if remaining_requests is not None:
+                self._requests = min(self._requests, float(remaining_requests))
+            if remaining_tokens is not None and self.max_tpm:
+                self._tokens = min(self._tokens, float(remaining_tokens))
+        except ValueError:
+            pass
@@ -0,0 +1,625 @@
+import json
+import math
+import time
+import asyncio
+import argparse
+
+import httpx
+import pytest
+from tenacity import (
+    AsyncRetrying,
+    Future,
+    RetryError,
+    retry_if_exception,
+    stop_after_attempt,
+)
+from instructor.exceptions import InstructorRetryException
+
+import drivelology_runner as runner
+from llm_cache import LLMCache
+
+
+def chat_completion(content: str, model: str = "m") -> dict:
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+    }
+
+
+def mock_provider(handler, **kwargs) -> runner.OpenRouter:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return runner.OpenRouter(api_key="k1", http_client=client, **kwargs)
+
+
+def test_structured_response_returns_response_model():
+    def handler(request):
+        content = json.dumps({"reason": "r", "category": "pure nonsense"})
+        return httpx.Response(200, json=chat_completion(content))
+
+    llm = mock_provider(handler)
+    response = asyncio.run(llm.structured_response(
+        "prompt", runner.DrivelologyResponseModel, llm_model="m"
+    ))
+    assert isinstance(response, runner.DrivelologyResponseModel)
+    assert response.category == "pure nonsense"
+
+
+def status_error(status: int, message: str, code=None, headers=None) -> Exception:
+    request = httpx.Request("POST", "https://openrouter.ai/api/v1/chat/completions")
+    response = httpx.Response(status, headers=headers, request=request)
+    error_cls = {429: runner.RateLimitError, 500: runner.InternalServerError}.get(
+        status, runner.APIStatusError
+    )
+    return error_cls(message, response=response, body={"message": message, "code": code})
+
+
+def instructor_error(exc: Exception) -> Exception:
+    """`exc` as Instructor raises it after its own retries give up."""
+    attempt = Future.construct(1, exc, True)
+    error = InstructorRetryException(str(exc), n_attempts=1, total_usage=0)
+    error.__cause__ = RetryError(attempt)
+    return error
+
+
+@pytest.mark.parametrize("exc, transient", [
+    (status_error(429, "Rate limit exceeded: 20 per minute"), True),
+    (status_error(500, "Internal error"), True),
+    (status_error(429, "Rate limit exceeded: free-models-per-day"), False),
+    (status_error(429, "You exceeded your quota", code="insufficient_quota"), False),
+    (status_error(402, "Insufficient credits"), False),
+    (status_error(400, "Bad request"), False),
+])
+def test_is_transient_error(exc, transient):
+    assert runner.is_transient_error(exc) is transient
+    assert runner.is_transient_error(instructor_error(exc)) is transient
+
+
+def test_invalid_output_after_instructor_retries_is_transient():
+    assert runner.is_transient_error(instructor_error(ValueError("invalid JSON")))
+    assert not runner.is_transient_error(ValueError("bug"))
+
+
+def test_retry_after_seconds():
+    retry_after = status_error(429, "slow down", headers={"retry-after": "7"})
+    assert runner.retry_after_seconds(retry_after) == 7.0
+    reset_at = int((time.time() + 30) * 1000)
+    reset = status_error(429, "slow down", headers={"x-ratelimit-reset": str(reset_at)})
+    assert 28 < runner.retry_after_seconds(instructor_error(reset)) <= 30
+    assert runner.retry_after_seconds(status_error(429, "slow down"), default=5) == 5
+    assert runner.retry_after_seconds(ValueError("no response"), default=5) == 5
+
+
+def test_exhausted_key_error_is_sent_once():
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("x-stainless-retry-count"))
+        return httpx.Response(
+            429, json={"error": {"message": "Rate limit exceeded: free-models-per-day"}}
+        )
+
+    llm = mock_provider(handler)
+    with pytest.raises(runner.RateLimitError):
+        asyncio.run(llm.structured_response(
+            "prompt", runner.DrivelologyResponseModel, llm_model="m"
+        ))
+    # Neither the SDK nor tenacity resends a request the key can never serve
+    assert seen == ["0"]
+
+
+class MockBatchAPI:
+    """Just enough of the Files and Batches endpoints for `batch_generate_data`."""
+
+    def __init__(self, status="completed", output="", errors=""):
+        self.status = status
+        self.output = output
+        self.errors = errors
+        self.calls = []
+        self.fail_output_download = False
+
+    def batch(self) -> dict:
+        completed = self.status == "completed"
+        return {
+            "id": "batch_1",
+            "object": "batch",
+            "endpoint": "/v1/chat/completions",
+            "input_file_id": "file_in",
+            "completion_window": "24h",
+            "created_at": 0,
+            "status": self.status,
+            "output_file_id": "file_out" if completed and self.output else None,
+            "error_file_id": "file_err" if completed and self.errors else None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        self.calls.append(f"{request.method} {path}")
+        if path == "/v1/files":
+            return httpx.Response(200, json={
+                "id": "file_in", "object": "file", "bytes": 0, "created_at": 0,
+                "filename": "batch.jsonl", "purpose": "batch", "status": "processed",
+            })
+        if path.startswith("/v1/batches"):
+            return httpx.Response(200, json=self.batch())
+        if path == "/v1/files/file_out/content":
+            if self.fail_output_download:
+                return httpx.Response(400, json={"error": {"message": "download failed"}})
+            return httpx.Response(200, text=self.output)
+        if path == "/v1/files/file_err/content":
+            return httpx.Response(200, text=self.errors)
+        raise AssertionError(f"unexpected request {request.method} {path}")
+
+
+def batch_line(custom_id: str, content: str, status_code: int = 200) -> str:
+    body = {"choices": [{"message": {"content": content}}]}
+    return json.dumps({
+        "custom_id": custom_id,
+        "response": {"status_code": status_code, "body": body},
+        "error": None,
+    })
+
+
+def batch_provider(api: MockBatchAPI, cache=None) -> runner.AsyncOpenAIProvider:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(api))
+    return runner.AsyncOpenAIProvider(api_key="sk", http_client=client, cache=cache)
+
+
+def run_batch(llm, prompts, batch_file):
+    return asyncio.run(llm.batch_generate_data(
+        prompts,
+        llm_model="m",
+        response_model=runner.DrivelologyResponseModel,
+        batch_file=str(batch_file),
+        poll_interval=0,
+    ))
+
+
+def test_batch_submits_and_parses_output(tmp_path):
+    valid = json.dumps({"reason": "r", "category": "normal sentence"})
+    api = MockBatchAPI(
+        output="\n".join([
+            batch_line("1", valid),
+            batch_line("2", "not json"),
+            batch_line("3", "{}", status_code=500),
+        ]),
+        errors=json.dumps({
+            "custom_id": "4",
+            "response": {"status_code": 400, "body": {"error": {"message": "bad"}}},
+            "error": None,
+        }),
+    )
+    cache = LLMCache(str(tmp_path / "cache.sqlite"))
+    llm = batch_provider(api, cache=cache)
+    prompts = {"1": "a", "2": "b", "3": "c", "4": "d"}
+
+    results = run_batch(llm, prompts, tmp_path / "x.batch.jsonl")
+    # Invalid and failed requests are left out rather than failing the batch
+    assert list(results) == ["1"]
+    assert results["1"].category == "normal sentence"
+    assert "POST /v1/files" in api.calls and "GET /v1/files/file_err/content" in api.calls
+    assert len((tmp_path / "x.batch.jsonl").read_text().splitlines()) == 4
+    assert not (tmp_path / "x.batch.id").exists()
+
+    # Cached rows are served without submitting another batch
+    api.calls.clear()
+    assert list(run_batch(llm, {"1": "a"}, tmp_path / "x.batch.jsonl")) == ["1"]
+    assert api.calls == []
+    cache.close()
+
+
+def test_batch_resumes_saved_batch_id(tmp_path):
+    api = MockBatchAPI(
+        output=batch_line("1", json.dumps({"reason": "r", "category": "pure nonsense"})),
+    )
+    (tmp_path / "x.batch.id").write_text("batch_1")
+    llm = batch_provider(api)
+
+    results = run_batch(llm, {"1": "a", "2": "b"}, tmp_path / "x.batch.jsonl")
+    assert list(results) == ["1"]
+    # No re-upload: the saved batch is polled and its output read
+    assert "POST /v1/files" not in api.calls
+    assert "POST /v1/batches" not in api.calls
+    assert not (tmp_path / "x.batch.id").exists()
+
+
+def test_batch_id_survives_failed_output_download(tmp_path):
+    api = MockBatchAPI(
+        output=batch_line("1", json.dumps({"reason": "r", "category": "pure nonsense"})),
+    )
+    api.fail_output_download = True
+    llm = batch_provider(api)
+
+    with pytest.raises(runner.APIStatusError):
+        run_batch(llm, {"1": "a"}, tmp_path / "x.batch.jsonl")
+    assert (tmp_path / "x.batch.id").read_text() == "batch_1"
+
+
+def test_batch_resubmits_after_failed_batch(tmp_path):
+    api = MockBatchAPI(status="expired")
+    (tmp_path / "x.batch.id").write_text("batch_1")
+    llm = batch_provider(api)
+
+    with pytest.raises(RuntimeError, match="expired"):
+        run_batch(llm, {"1": "a"}, tmp_path / "x.batch.jsonl")
+    assert "POST /v1/batches" in api.calls
+    assert not (tmp_path / "x.batch.id").exists()
+
+
+def mock_sheet(monkeypatch, values):
+    """Make `load_worksheet` read `values` instead of calling the Sheets API."""
+    class Request:
+        def execute(self):
+            return {"valueRanges": [{"values": values} if values else {}]}
+
+    class Service:
+        def spreadsheets(self):
+            return self
+
+        def values(self):
+            return self
+
+        def batchGet(self, **kwargs):
+            return Request()
+
+    monkeypatch.setattr(runner.Credentials, "from_service_account_file", lambda *a, **kw: None)
+    monkeypatch.setattr(runner, "build", lambda *args, **kwargs: Service())
+
+
+def test_load_worksheet_pads_and_truncates_rows(monkeypatch):
+    header = ["id", "text", "created_datetime", "modified_datetime"]
+    mock_sheet(monkeypatch, [
+        header,
+        [1, "a", "2025-01-01", "2025-01-02"],
+        [2, "b"],
+        [3, "c", "2025-01-01", "2025-01-02", "", "stray note"],
+    ])
+
+    worksheet_df = runner.load_worksheet("service.json", "sheet")
+    assert list(worksheet_df.columns) == header
+    assert worksheet_df.values.tolist() == [
+        [1, "a", "2025-01-01", "2025-01-02"],
+        [2, "b", "", ""],
+        [3, "c", "2025-01-01", "2025-01-02"],
+    ]
+
+
+def test_rows_of_empty_worksheet(tmp_path, monkeypatch):
+    mock_sheet(monkeypatch, [])
+    drivelology_runner = runner.DrivelologyRunner("service.json", "sheet", data_dir=str(tmp_path))
+    try:
+        assert drivelology_runner.rows() == []
+    finally:
+        asyncio.run(drivelology_runner.aclose())
+
+
+def test_rows_normalise_text(tmp_path, monkeypatch):
+    mock_sheet(monkeypatch, [
+        ["id", "text", "created_datetime", "modified_datetime"],
+        [1, " line one\nline two ", "c", "m"],
+        [2, 42, "c", "m"],
+    ])
+    drivelology_runner = runner.DrivelologyRunner("service.json", "sheet", data_dir=str(tmp_path))
+    try:
+        assert drivelology_runner.rows() == [
+            (1, "line one line two", "c", "m"),
+            (2, "42", "c", "m"),
+        ]
+    finally:
+        asyncio.run(drivelology_runner.aclose())
+
+
+def test_generate_data_drops_exhausted_key_and_rotates():
+    seen = []
+
+    def handler(request):
+        key = request.headers["authorization"].removeprefix("Bearer ")
+        seen.append(key)
+        if key == "k1":
+            return httpx.Response(
+                429, json={"error": {"message": "Rate limit exceeded: free-models-per-day"}}
+            )
+        content = json.dumps({"reason": "r", "category": "normal sentence"})
+        return httpx.Response(200, json=chat_completion(content))
+
+    key_pool = runner.APIKeyPool(["k1", "k2"])
+    llm = mock_provider(handler, key_pool=key_pool)
+
+    async def classify_twice():
+        with pytest.raises(runner.RateLimitError):
+            await llm.generate_data("a", llm_model="m", response_model=runner.DrivelologyResponseModel)
+        return await llm.generate_data("a", llm_model="m", response_model=runner.DrivelologyResponseModel)
+
+    response = asyncio.run(classify_twice())
+    assert response.category == "normal sentence"
+    assert seen == ["k1", "k2"]
+    assert key_pool.keys == ["k2"]
+
+
+def test_rate_limited_key_cools_down_and_retry_uses_next_key(monkeypatch):
+    seen = []
+
+    def handler(request):
+        key = request.headers["authorization"].removeprefix("Bearer ")
+        seen.append(key)
+        if key == "k1":
+            return httpx.Response(
+                429, headers={"retry-after": "30"}, json={"error": {"message": "slow down"}}
+            )
+        content = json.dumps({"reason": "r", "category": "normal sentence"})
+        return httpx.Response(200, json=chat_completion(content))
+
+    # Retry at once instead of backing off for real
+    monkeypatch.setattr(runner, "api_retrying", lambda: AsyncRetrying(
+        stop=stop_after_attempt(2),
+        retry=retry_if_exception(runner.is_transient_error),
+        reraise=True,
+    ))
+    key_pool = runner.APIKeyPool(["k1", "k2"])
+    llm = mock_provider(handler, key_pool=key_pool)
+
+    async def classify_then_acquire():
+        response = await llm.structured_response(
+            "a", runner.DrivelologyResponseModel, llm_model="m"
+        )
+        return response, [await key_pool.acquire() for _ in range(2)]
+
+    response, next_keys = asyncio.run(classify_then_acquire())
+    assert response.category == "normal sentence"
+    assert seen == ["k1", "k2"]
+    # k1 is kept but skipped while it cools off
+    assert key_pool.keys == ["k1", "k2"]
+    assert next_keys == ["k2", "k2"]
+
+
+def test_key_pool_round_robin_skips_cooling_keys():
+    async def acquire_keys():
+        key_pool = runner.APIKeyPool(["a", "b", "c"])
+        first = [await key_pool.acquire() for _ in range(3)]
+        key_pool.cool_down("b", 60)
+        rest = [await key_pool.acquire() for _ in range(2)]
+        return first, rest
+
+    first, rest = asyncio.run(acquire_keys())
+    assert first == ["a", "b", "c"]
+    assert rest == ["a", "c"]
+
+
+def test_key_pool_waits_for_cool_down():
+    async def acquire_after_cool_down():
+        key_pool = runner.APIKeyPool(["a"])
+        key_pool.cool_down("a", 0.05)
+        return await key_pool.acquire()
+
+    assert asyncio.run(acquire_after_cool_down()) == "a"
+
+
+def test_key_pool_raises_when_empty():
+    key_pool = runner.APIKeyPool(["a"])
+    key_pool.discard("a")
+    with pytest.raises(runner.KeyPoolExhausted):
+        asyncio.run(key_pool.acquire())
+
+
+def test_load_api_keys_drops_blanks_and_duplicates(tmp_path):
+    key_file = tmp_path / "keys.txt"
+    key_file.write_text("k1\n\n k2 \nk1\n")
+    assert runner.load_api_keys(str(key_file)) == ["k1", "k2"]
+
+
+def test_empty_key_file_is_rejected(tmp_path, monkeypatch):
+    key_file = tmp_path / "openrouter.txt"
+    key_file.write_text("\n")
+    monkeypatch.setattr(runner.OpenRouter, "KEY_FILE", str(key_file))
+    drivelology_runner = runner.DrivelologyRunner("service.json", "sheet", data_dir=str(tmp_path))
+    try:
+        with pytest.raises(ValueError, match="No API keys"):
+            drivelology_runner.provider("openrouter")
+    finally:
+        asyncio.run(drivelology_runner.aclose())
+
+
+def test_load_exist_ids_repairs_torn_line(tmp_path):
+    save_file = tmp_path / "out.jsonl"
+    save_file.write_bytes(b'{"id": 1}\n{"id": 2}\n{"id": 3, "te')
+
+    assert runner.load_exist_ids(str(save_file)) == {1, 2}
+    # The torn line is terminated so the next record starts on its own line
+    with open(save_file, "ab") as f:
+        f.write(b'{"id": 4}\n')
+    assert runner.load_exist_ids(str(save_file)) == {1, 2, 4}
+
+
+def test_load_exist_ids_skips_malformed_lines(tmp_path):
+    save_file = tmp_path / "out.jsonl"
+    save_file.write_bytes(b'{"id": 1}\nnot json\n\n{"id": 2}\n')
+    assert runner.load_exist_ids(str(save_file)) == {1, 2}
+    assert save_file.read_bytes().endswith(b'{"id": 2}\n')
+
+
+def test_load_exist_ids_missing_file(tmp_path):
+    assert runner.load_exist_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_run_pipeline_fans_out_groups_and_skips_failures():
+    groups = [[(1, "a"), (3, "a")], [(2, "b")], [(4, "bad")]]
+    prompts = []
+    written = []
+
+    async def classify(prompt):
+        prompts.append(prompt)
+        if "bad" in prompt:
+            raise ValueError("invalid output")
+        return prompt
+
+    asyncio.run(runner.run_pipeline(
+        groups, classify, lambda id, text, response: written.append(id), workers=2
+    ))
+    assert sorted(prompts) == sorted(
+        f"{runner.PROMPT_PREFIX}{text}{runner.PROMPT_SUFFIX}" for text in ("a", "b", "bad")
+    )
+    assert sorted(written) == [1, 2, 3]
+
+
+def test_run_pipeline_stops_when_keys_run_out():
+    calls = []
+    written = []
+
+    async def classify(prompt):
+        calls.append(prompt)
+        if len(calls) <= 2:
+            return prompt
+        await asyncio.sleep(0)
+        raise runner.KeyPoolExhausted("No usable API keys left in the pool")
+
+    groups = [[(i, str(i))] for i in range(100)]
+    with pytest.raises(runner.KeyPoolExhausted):
+        asyncio.run(runner.run_pipeline(
+            groups, classify, lambda id, text, response: written.append(id), workers=3
+        ))
+    # Rows finished before the failure are still written
+    assert sorted(written) == [0, 1]
+    assert len(calls) < 10
+
+
+def mock_runner(tmp_path, monkeypatch, handler, values) -> runner.DrivelologyRunner:
+    """A runner reading `values` as the sheet and `handler` as the API."""
+    mock_sheet(monkeypatch, values)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk")
+    monkeypatch.setattr(runner, "estimate_tokens", lambda prompt, llm_model: len(prompt) // 4)
+    drivelology_runner = runner.DrivelologyRunner(
+        "service.json", "sheet", data_dir=str(tmp_path), max_concurrency=2
+    )
+    drivelology_runner.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return drivelology_runner
+
+
+SHEET = [["id", "text", "created_datetime", "modified_datetime"]] + [
+    [i, f"text {i}", "c", "m"] for i in range(20)
+]
+
+
+def test_run_stops_when_single_key_is_unusable(tmp_path, monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(401, json={"error": {"message": "Incorrect API key"}})
+
+    drivelology_runner = mock_runner(tmp_path, monkeypatch, handler, SHEET)
+
+    async def run():
+        try:
+            await drivelology_runner.run("openai", "gpt-4o-mini", "out.jsonl")
+        finally:
+            await drivelology_runner.aclose()
+
+    with pytest.raises(runner.APIKeyExhausted):
+        asyncio.run(run())
+    # Each worker hits the dead key at most once, not once per row
+    assert len(seen) <= 2
+
+
+class DigitEncoding:
+    """Stands in for tiktoken, whose BPE files may not be downloadable."""
+
+    def encode(self, text: str) -> list[int]:
+        return [ord(char) for char in text]
+
+
+def label_completion(token: str, probability: float) -> dict:
+    completion = chat_completion(token)
+    completion["choices"][0]["logprobs"] = {"content": [{
+        "token": token,
+        "logprob": math.log(probability),
+        "bytes": None,
+        "top_logprobs": [],
+    }]}
+    return completion
+
+
+def test_label_response_scores_one_token_and_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, "encoding_for_model", lambda llm_model: DigitEncoding())
+    bodies = []
+
+    def handler(request):
+        bodies.append(json.loads(request.content))
+        return httpx.Response(200, json=label_completion("3", 0.8))
+
+    cache = LLMCache(str(tmp_path / "cache.sqlite"))
+    llm = mock_provider(handler, cache=cache)
+
+    async def label_twice():
+        return [
+            await llm.label_response("prompt", runner.CATEGORIES, llm_model="m")
+            for _ in range(2)
+        ]
+
+    first, second = asyncio.run(label_twice())
+    assert first[0] == second[0] == runner.CATEGORIES[2]
+    assert first[1] == second[1] == pytest.approx(0.8)
+    assert len(bodies) == 1
+    assert bodies[0]["max_tokens"] == 1
+    assert bodies[0]["logprobs"] is True
+    assert set(bodies[0]["logit_bias"]) == {str(ord(str(i))) for i in range(1, 8)}
+    cache.close()
+
+
+def test_run_label_only_falls_back_below_confidence(tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, "encoding_for_model", lambda llm_model: DigitEncoding())
+
+    def handler(request):
+        body = json.loads(request.content)
+        prompt = body["messages"][0]["content"]
+        if "max_tokens" in body:
+            probability = 0.5 if "unsure" in prompt else 0.99
+            return httpx.Response(200, json=label_completion("6", probability))
+        content = json.dumps({"reason": "because", "category": "normal sentence"})
+        return httpx.Response(200, json=chat_completion(content))
+
+    drivelology_runner = mock_runner(tmp_path, monkeypatch, handler, [
+        ["id", "text", "created_datetime", "modified_datetime"],
+        [1, "sure", "c", "m"],
+        [2, "unsure", "c", "m"],
+    ])
+
+    async def run():
+        try:
+            await drivelology_runner.run("openai", "gpt-4o-mini", "out.jsonl", label_only=True)
+        finally:
+            await drivelology_runner.aclose()
+
+    asyncio.run(run())
+    records = {
+        record["id"]: record
+        for record in map(json.loads, (tmp_path / "out.jsonl").read_text().splitlines())
+    }
+    assert records[1]["category"] == "pure nonsense" and records[1]["reason"] == ""
+    assert records[2]["category"] == "normal sentence" and records[2]["reason"] == "because"
+
+
+def test_main_exits_non_zero_when_a_job_fails(tmp_path, monkeypatch):
+    async def run(self, provider, model, out, **kwargs):
+        if provider == "openrouter":
+            raise runner.KeyPoolExhausted("No usable API keys left in the pool")
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DRIVELOLOGY_SPREADSHEET_ID", "sheet")
+    monkeypatch.setattr(runner.DrivelologyRunner, "run", run)
+    args = argparse.Namespace(
+        service_file="service.json", provider=None, model=None, out=None,
+        batch=False, label_only=False,
+    )
+    with pytest.raises(SystemExit) as exc_info:
+        asyncio.run(runner.main(args))
+    assert exc_info.value.code == 1
+
+    args.provider, args.model, args.out = "openai", "gpt-4o-mini", "out.jsonl"
+    asyncio.run(runner.main(args))
@@ -0,0 +1,33 @@
+from llm_cache import LLMCache
+
+
+def test_round_trip_is_keyed_by_model_and_prompt(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"))
+    cache.set("m", "prompt", '{"category": "a"}')
+
+    assert cache.get("m", "prompt") == '{"category": "a"}'
+    assert cache.get("other", "prompt") is None
+    assert cache.get("m", "other") is None
+    cache.close()
+
+
+def test_set_replaces_and_expires(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"))
+    cache.set("m", "prompt", '{"category": "a"}')
+    cache.set("m", "prompt", '{"category": "b"}', ttl=60)
+    cache.set("m", "stale", '{"category": "c"}', ttl=-1)
+
+    assert cache.get("m", "prompt") == '{"category": "b"}'
+    assert cache.get("m", "stale") is None
+    cache.close()
+
+
+def test_persists_across_connections(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = LLMCache(path)
+    cache.set("m", "prompt", '{"category": "a"}')
+    cache.close()
+
+    cache = LLMCache(path)
+    assert cache.get("m", "prompt") == '{"category": "a"}'
+    cache.close()
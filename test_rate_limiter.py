@@ -0,0 +1,67 @@
+import time
+import asyncio
+
+import httpx
+
+from rate_limiter import RateLimiter
+
+
+def test_acquire_is_immediate_within_budget():
+    async def acquire_all():
+        rate_limiter = RateLimiter(max_rpm=60, max_tpm=1_000)
+        start = time.monotonic()
+        for _ in range(10):
+            await rate_limiter.acquire(tokens=100)
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire_all()) < 0.05
+
+
+def test_acquire_waits_for_request_refill():
+    async def acquire_past_budget():
+        # 6000 RPM refills one request every 10 ms
+        rate_limiter = RateLimiter(max_rpm=6_000)
+        rate_limiter._requests = 0
+        start = time.monotonic()
+        await rate_limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire_past_budget()) >= 0.009
+
+
+def test_acquire_waits_for_token_refill():
+    async def acquire_past_budget():
+        # 60_000 TPM refills 10 tokens every 10 ms
+        rate_limiter = RateLimiter(max_rpm=6_000, max_tpm=60_000)
+        rate_limiter._tokens = 0
+        start = time.monotonic()
+        await rate_limiter.acquire(tokens=10)
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire_past_budget()) >= 0.009
+
+
+def test_oversized_prompt_is_capped_at_max_tpm():
+    async def acquire_oversized():
+        rate_limiter = RateLimiter(max_rpm=60, max_tpm=100)
+        await asyncio.wait_for(rate_limiter.acquire(tokens=10_000), timeout=1)
+
+    asyncio.run(acquire_oversized())
+
+
+def test_update_clamps_to_server_remaining():
+    rate_limiter = RateLimiter(max_rpm=100, max_tpm=1_000)
+    rate_limiter.update(httpx.Headers({
+        "x-ratelimit-remaining-requests": "3",
+        "x-ratelimit-remaining-tokens": "50",
+    }))
+    assert rate_limiter._requests < 3.1
+    assert rate_limiter._tokens < 50.1
+
+
+def test_update_accepts_openrouter_header_and_ignores_garbage():
+    rate_limiter = RateLimiter(max_rpm=100)
+    rate_limiter.update(httpx.Headers({"x-ratelimit-remaining": "5"}))
+    assert rate_limiter._requests < 5.1
+    rate_limiter.update(httpx.Headers({"x-ratelimit-remaining": "n/a"}))
+    assert rate_limiter._requests < 5.1